@@ -1,16 +1,21 @@
 import streamlit as st
-import fitz  # PyMuPDF
 import io
 import re
-import csv
-import nltk
 import spacy
-import os, json, yaml, time
+from spacy.matcher import PhraseMatcher
+from spacy.attrs import POS, LEMMA, ORTH, IS_STOP, IS_SPACE, IS_PUNCT, LIKE_NUM
+from spacy.parts_of_speech import ADJ, NOUN, PROPN, VERB
+from spacy.strings import hash_string
+from spacy.lang.en.stop_words import STOP_WORDS
+import os, sys, json, yaml, time
+import functools
+import numpy as np
+import pandas as pd
+import hashlib
+import codecs
+import tempfile
 from typing import Tuple, Dict, Any
-from nltk.corpus import stopwords
-from docx import Document
-from striprtf.striprtf import rtf_to_text
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
 # ---------------- Page setup ----------------
 st.set_page_config(
@@ -48,9 +53,16 @@ st.markdown(
 st.markdown("---")
 
 # ---------------- Load NLP tools ----------------
-nlp = spacy.load("en_core_web_sm")
-nltk.download("stopwords")
-stop_words = set(stopwords.words("english"))
+# Cached per process so Streamlit reruns don't reload the model.
+# The model is loaded on first analysis (get_nlp() at the use sites), not before the first page paint.
+@st.cache_resource(show_spinner="Loading language model…")
+def get_nlp():
+    # NER is not needed: numeric/date-like tokens are filtered with `like_num` instead.
+    # Parser is not needed: phrases come from POS runs (_pos_runs) rather than doc.noun_chunks.
+    return spacy.load("en_core_web_sm", disable=["ner", "parser"])
+
+# spaCy's English stop list ships with the package: no corpus download, and already a set
+stop_words = frozenset(STOP_WORDS)
 
 # =========================================================
 # ============ Auto-updating Configs (NEW) ================
@@ -116,112 +128,191 @@ def _safe_read_json(path: str, default: Any) -> Any:
         pass
     return default
 
+# libyaml-backed safe loader when PyYAML was built with it; pure-Python SafeLoader otherwise
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 def _safe_read_yaml(path: str, default: Any) -> Any:
     try:
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
-                return yaml.safe_load(f)
+                return yaml.load(f, Loader=_YAML_LOADER)
     except Exception:
         pass
     return default
 
+def _atomic_write_text(path: str, text: str) -> None:
+    # Write a temp file in the same dir, then os.replace(): the hot-reload check never sees a torn file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _atomic_write_json(path: str, obj: Any) -> None:
+    _atomic_write_text(path, json.dumps(obj, indent=2))
+
 def _ensure_files():
     os.makedirs(CFG_DIR, exist_ok=True)
     os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(WEIGHTS_PATH):   open(WEIGHTS_PATH, "w").write(yaml.safe_dump(BUILTIN_WEIGHTS, sort_keys=False))
-    if not os.path.exists(PROFILES_PATH):  open(PROFILES_PATH, "w").write(json.dumps(BUILTIN_PROFILES, indent=2))
-    if not os.path.exists(SYN_BASE_PATH):  open(SYN_BASE_PATH, "w").write(json.dumps(BUILTIN_SYNONYMS, indent=2))
-    if not os.path.exists(SYN_USER_PATH):  open(SYN_USER_PATH, "w").write(json.dumps({}, indent=2))
-    if not os.path.exists(STOP_PATH):      open(STOP_PATH, "w").write(json.dumps(BUILTIN_STOP, indent=2))
+    if not os.path.exists(WEIGHTS_PATH):   _atomic_write_text(WEIGHTS_PATH, yaml.safe_dump(BUILTIN_WEIGHTS, sort_keys=False))
+    if not os.path.exists(PROFILES_PATH):  _atomic_write_json(PROFILES_PATH, BUILTIN_PROFILES)
+    if not os.path.exists(SYN_BASE_PATH):  _atomic_write_json(SYN_BASE_PATH, BUILTIN_SYNONYMS)
+    if not os.path.exists(SYN_USER_PATH):  _atomic_write_json(SYN_USER_PATH, {})
+    if not os.path.exists(STOP_PATH):      _atomic_write_json(STOP_PATH, BUILTIN_STOP)
     if not os.path.exists(TELEMETRY_PATH): open(TELEMETRY_PATH, "a").close()
 
+CFG_PATHS = (WEIGHTS_PATH, PROFILES_PATH, SYN_BASE_PATH, SYN_USER_PATH, STOP_PATH)
+
+def _stat_many(paths) -> tuple:
+    """One os.stat() per path -> ((mtime_ns, size), ...); a missing file gives (0, 0)."""
+    sig = []
+    for p in paths:
+        try:
+            s = os.stat(p)
+            sig.append((s.st_mtime_ns, s.st_size))
+        except FileNotFoundError:
+            sig.append((0, 0))
+    return tuple(sig)
+
 def _load_configs():
+    sig = _stat_many(CFG_PATHS)  # taken before reading, so an edit mid-read triggers another reload
     weights = _safe_read_yaml(WEIGHTS_PATH, BUILTIN_WEIGHTS)
     profiles = _safe_read_json(PROFILES_PATH, BUILTIN_PROFILES)
     syn_base = _safe_read_json(SYN_BASE_PATH, BUILTIN_SYNONYMS)
     syn_user = _safe_read_json(SYN_USER_PATH, {})
-    synonyms = {**syn_base, **syn_user}
-    stops = _safe_read_json(STOP_PATH, BUILTIN_STOP)
-    mtimes = {
-        "weights": os.path.getmtime(WEIGHTS_PATH) if os.path.exists(WEIGHTS_PATH) else 0,
-        "profiles":os.path.getmtime(PROFILES_PATH) if os.path.exists(PROFILES_PATH) else 0,
-        "syn_base":os.path.getmtime(SYN_BASE_PATH) if os.path.exists(SYN_BASE_PATH) else 0,
-        "syn_user":os.path.getmtime(SYN_USER_PATH) if os.path.exists(SYN_USER_PATH) else 0,
-        "stops":  os.path.getmtime(STOP_PATH) if os.path.exists(STOP_PATH) else 0,
-    }
-    return weights, profiles, synonyms, stops, mtimes
-
-def _hot_reload_if_changed(state_key="cfg_mtimes"):
-    mtimes_now = {
-        "weights": os.path.getmtime(WEIGHTS_PATH) if os.path.exists(WEIGHTS_PATH) else 0,
-        "profiles":os.path.getmtime(PROFILES_PATH) if os.path.exists(PROFILES_PATH) else 0,
-        "syn_base":os.path.getmtime(SYN_BASE_PATH) if os.path.exists(SYN_BASE_PATH) else 0,
-        "syn_user":os.path.getmtime(SYN_USER_PATH) if os.path.exists(SYN_USER_PATH) else 0,
-        "stops":  os.path.getmtime(STOP_PATH) if os.path.exists(STOP_PATH) else 0,
-    }
-    old = st.session_state.get(state_key)
-    if old is None or any(mtimes_now[k] != old.get(k, -1) for k in mtimes_now):
-        (st.session_state["weights_cfg"],
-         st.session_state["profiles_cfg"],
-         st.session_state["synonyms"],
-         st.session_state["stop_phrases"],
-         st.session_state[state_key]) = _load_configs()
-        st.toast("Configs reloaded ✅", icon="🔄")
-
-# Ensure config files, load once, and hot-reload on changes
-_ensure_files()
-if "weights_cfg" not in st.session_state:
+    synonyms = _merge_synonyms(syn_base, syn_user)
+    stops = [sys.intern(s.lower()) for s in _safe_read_json(STOP_PATH, BUILTIN_STOP)]
+    return weights, profiles, synonyms, stops, sig
+
+def _merge_synonyms(base: Dict[str, str], user: Dict[str, str]) -> Dict[str, str]:
+    # Interned keys/values: term lookups hit the pointer-equality fast path in dict/set probes
+    return {sys.intern(k): sys.intern(v) for k, v in {**base, **user}.items()}
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _config_version(obj: Any) -> str:
+    """Content digest of a synonyms dict / stop-phrase list; keys the cached term extraction."""
+    return _digest(json.dumps(obj, sort_keys=True).encode("utf-8"))
+
+def _compile_stop_re(stops) -> "re.Pattern":
+    """One alternation over all stop phrases (longest first), bounded so they only match whole words."""
+    phrases = sorted({p.lower() for p in stops if p.strip()}, key=len, reverse=True)
+    if not phrases:
+        return re.compile(r"(?!)")  # matches nothing
+    return re.compile(r"(?<!\w)(?:" + "|".join(map(re.escape, phrases)) + r")(?!\w)")
+
+def _invert_synonyms(synonyms: Dict[str, str]) -> Dict[str, list]:
+    """canonical -> [variants]; lets expand_synonyms skip scanning the whole map."""
+    inverse = {}
+    for k, v in synonyms.items():
+        inverse.setdefault(v, []).append(k)
+    return inverse
+
+def _store_configs(state_key="cfg_sig"):
     (st.session_state["weights_cfg"],
      st.session_state["profiles_cfg"],
      st.session_state["synonyms"],
      st.session_state["stop_phrases"],
-     st.session_state["cfg_mtimes"]) = _load_configs()
-_hot_reload_if_changed()
+     st.session_state[state_key]) = _load_configs()
+    st.session_state["syn_version"] = _config_version(st.session_state["synonyms"])
+    st.session_state["synonyms_inv"] = _invert_synonyms(st.session_state["synonyms"])
+    st.session_state["stop_version"] = _config_version(sorted(st.session_state["stop_phrases"]))
+    st.session_state["stop_re"] = _compile_stop_re(st.session_state["stop_phrases"])
+
+def _hot_reload_if_changed(state_key="cfg_sig") -> bool:
+    # (mtime_ns, size) tuples also catch same-second edits that float mtimes could miss
+    if st.session_state.get(state_key) != _stat_many(CFG_PATHS):
+        _store_configs(state_key)
+        st.toast("Configs reloaded ✅", icon="🔄")
+        return True
+    return False
+
+# Config files are polled on a timer rather than on every widget interaction.
+# run_every ticks in every open session, idle ones included; a tick is a handful of os.stat() calls.
+RELOAD_POLL_SECONDS = 30
+RELOAD_POLL_SLACK = 5   # timer ticks can land slightly early; don't let that push a poll to the next tick
+_fragment = getattr(st, "fragment", None) or st.experimental_fragment  # st.fragment is 1.37+
+
+@_fragment(run_every=RELOAD_POLL_SECONDS)
+def _config_watcher():
+    # The fragment body also runs during full reruns; skip the stat() calls unless a poll is due
+    now = time.monotonic()
+    if now - st.session_state.get("_cfg_checked_at", 0.0) < RELOAD_POLL_SECONDS - RELOAD_POLL_SLACK:
+        return
+    st.session_state["_cfg_checked_at"] = now
+    if _hot_reload_if_changed():
+        st.rerun()  # inside a fragment on 1.36 this reruns the whole app, so every widget sees the new configs
+
+# Ensure config files once per session, load once, and hot-reload on changes
+if not st.session_state.get("_bootstrapped"):
+    _ensure_files()
+    st.session_state["_bootstrapped"] = True
+if any(k not in st.session_state for k in ("weights_cfg", "syn_version", "synonyms_inv", "stop_version", "stop_re")):
+    _store_configs()
+    st.session_state["_cfg_checked_at"] = time.monotonic()
+_config_watcher()
 
 # Sidebar admin quick action
 st.sidebar.markdown("---")
 if st.sidebar.button("🔄 Reload configs"):
-    (st.session_state["weights_cfg"],
-     st.session_state["profiles_cfg"],
-     st.session_state["synonyms"],
-     st.session_state["stop_phrases"],
-     st.session_state["cfg_mtimes"]) = _load_configs()
+    _store_configs()
     st.success("Configs reloaded from disk.")
 
 # Handy local variables
 WEIGHTS_CFG  = st.session_state["weights_cfg"]
 PROFILES_CFG = st.session_state["profiles_cfg"]
 SYNONYMS_MAP = st.session_state["synonyms"]
-STOP_PHRASES = set(map(str.lower, st.session_state["stop_phrases"]))
+SYNONYMS_INV = st.session_state["synonyms_inv"]
+STOP_PHRASES = set(st.session_state["stop_phrases"])  # lowercased + interned at load
+STOP_RE      = st.session_state["stop_re"]
 
 # ---------------- File text extractors ----------------
+def extract_pages_from_pdf(file_obj) -> list:
+    import fitz  # PyMuPDF, imported lazily: only needed for .pdf uploads
+    # getvalue() hands over the BytesIO/UploadedFile buffer without a read() copy
+    with fitz.open(stream=file_obj.getvalue(), filetype="pdf") as doc:
+        # plain-text mode with minimal post-processing: ligatures expand to plain letters (better
+        # keyword matches), whitespace is not preserved; only clipping to the visible page is kept
+        return [page.get_text("text", flags=fitz.TEXT_MEDIABOX_CLIP) for page in doc]
+
 def extract_text_from_pdf(file_obj) -> str:
-    with fitz.open(stream=file_obj.read(), filetype="pdf") as doc:
-        text = []
-        for page in doc:
-            text.append(page.get_text())
-    return "\n".join(text)
+    return "\n".join(extract_pages_from_pdf(file_obj))
 
 def extract_text_from_docx(file_obj) -> str:
-    data = file_obj.read()
-    bio = io.BytesIO(data)
-    doc = Document(bio)
-    return "\n".join(p.text for p in doc.paragraphs)
+    from docx import Document  # imported lazily: only needed for .docx uploads
+    file_obj.seek(0)
+    doc = Document(file_obj)  # python-docx takes the file-like object directly, no extra BytesIO copy
+    # p.text is rebuilt from runs on each access, so read it once; blank paragraphs are dropped
+    return "\n".join(t for t in (p.text for p in doc.paragraphs) if t)
+
+def _decode_text(data: bytes) -> str:
+    # Sniff the BOM first (UTF-16 "Unicode" saves from Notepad, UTF-8 with BOM), so the BOM doesn't
+    # leak into the text; otherwise UTF-8, and latin-1 only if that fails (it accepts any byte string)
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return data.decode("utf-16", errors="ignore")
+    if data.startswith(codecs.BOM_UTF8):
+        return data.decode("utf-8-sig", errors="ignore")
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
 
 def extract_text_from_rtf(file_obj) -> str:
-    data = file_obj.read()
-    try:
-        return rtf_to_text(data.decode("utf-8", errors="ignore"))
-    except Exception:
-        return rtf_to_text(data.decode("latin-1", errors="ignore"))
+    from striprtf.striprtf import rtf_to_text  # imported lazily: only needed for .rtf uploads
+    return rtf_to_text(_decode_text(file_obj.read()))
+
+# Markdown markers -> spaces via one C-level translate; then squash the space runs it leaves (not newlines)
+MD_CLEANUP_TABLE = str.maketrans(dict.fromkeys("#*_>`~-", " "))
+MD_SPACES_RE = re.compile(r" {2,}")
 
 def extract_text_from_txt(file_obj) -> str:
-    data = file_obj.read()
-    try:
-        text = data.decode("utf-8")
-    except Exception:
-        text = data.decode("latin-1", errors="ignore")
-    text = re.sub(r"[#*_>`~\-]{1,}", " ", text)  # light formatting cleanup
+    text = _decode_text(file_obj.read())
+    text = MD_SPACES_RE.sub(" ", text.translate(MD_CLEANUP_TABLE))  # light formatting cleanup
     return text
 
 def extract_text_from_any(file_obj, filename: str) -> str:
@@ -234,96 +325,186 @@ def extract_text_from_any(file_obj, filename: str) -> str:
         return extract_text_from_rtf(file_obj)
     return extract_text_from_txt(file_obj)
 
+def extract_pages_from_any(file_obj, filename: str) -> list:
+    # PDFs keep their pages so nlp.pipe can batch them; other formats are a single "page"
+    if filename.lower().endswith(".pdf"):
+        return extract_pages_from_pdf(file_obj)
+    return [extract_text_from_any(file_obj, filename)]
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def extract_pages_cached(data: bytes, filename: str) -> list:
+    # Keyed on the upload bytes, so reruns with the same file skip PyMuPDF/docx/rtf parsing
+    return extract_pages_from_any(io.BytesIO(data), filename)
+
 # ---------------- Dynamic term extraction (tokens + short phrases + acronyms) ----------------
-ALLOWED_VERBS = {
+ALLOWED_VERBS = frozenset({
     "test", "testing", "troubleshoot", "troubleshooting", "debug", "debugging",
     "integrate", "integration", "document", "documentation", "support",
     "analyze", "analysis"
-}
+})
+# -ing form added alongside each allowed verb lemma (integrate -> integrating), built once
+_VERB_ING_FORMS = {v: (v[:-1] + "ing" if v.endswith("e") else v + "ing") for v in ALLOWED_VERBS}
 
-ACRONYM_PATTERN = re.compile(r"\b[A-Z]{2,6}\b")                      # QA, API, ETL, SQL, HTTP, REST, CRM...
 CODEY_PATTERN   = re.compile(r"[A-Za-z0-9]+(?:[-_/][A-Za-z0-9]+)+")
+NUMERIC_RE      = re.compile(r"\d[\d,./-]*")                          # 2019-2021, 01/02/2020, 3.5...
 
-def _normalize_phrase(words):
-    lemmas = []
-    for t in words:
-        if t.is_space or t.is_punct:
-            continue
-        lemma = t.lemma_.lower().strip()
+def _normalize_phrase(lemmas) -> str:
+    # lemma strings of a chunk's non-stop tokens -> phrase, minus stopword / stop-phrase lemmas
+    kept = []
+    for lemma in lemmas:
+        lemma = lemma.lower().strip()
         if lemma and lemma not in stop_words and lemma not in STOP_PHRASES:
-            lemmas.append(lemma)
-    if not lemmas:
-        return ""
-    phrase = " ".join(lemmas)
-    phrase = SYNONYMS_MAP.get(phrase, phrase)
-    phrase = re.sub(r"\s{2,}", " ", phrase)
-    return phrase
+            kept.append(lemma)
+    return " ".join(kept)
+
+CHUNK_POS_IDS = (ADJ, NOUN, PROPN)
 
+def _pos_runs(pos) -> list:
+    """
+    [lo, hi) index ranges of noun-phrase-like runs in a POS column (ADJ/NOUN/PROPN, ending on a noun).
+    Stands in for doc.noun_chunks so the dependency parser can stay disabled.
+    """
+    in_run = np.concatenate(([False], np.isin(pos, CHUNK_POS_IDS), [False]))
+    edges = np.flatnonzero(in_run[1:] != in_run[:-1]).tolist()
+    runs = []
+    for lo, hi in zip(edges[::2], edges[1::2]):
+        while hi > lo and pos[hi - 1] == ADJ:
+            hi -= 1
+        if hi > lo:
+            runs.append((lo, hi))
+    return runs
+
+def _add_normalized(term: str, terms: set) -> None:
+    # single normalization point: synonym fold + whitespace squash + stop-phrase filter
+    term = SYNONYMS_MAP.get(term, term)
+    term = " ".join(term.split())
+    if term and term not in STOP_PHRASES:
+        terms.add(sys.intern(term))  # JD and resume copies of a term share one object
+
+@functools.lru_cache(maxsize=2048)
 def normalize_term(t: str) -> str:
-    t = t.lower().strip()
+    t = sys.intern(t.lower().strip())
     return SYNONYMS_MAP.get(t, t)
 
-def extract_terms(text: str) -> set:
-    # remove global stop phrases up-front
-    low = text.lower()
-    for p in STOP_PHRASES:
-        low = low.replace(p, " ")
-    doc = nlp(low)
+def _strip_stop_phrases(text: str) -> str:
+    # remove global stop phrases up-front, in one regex pass
+    return STOP_RE.sub(" ", text.lower())
+
+_TOKEN_ATTRS = [POS, LEMMA, ORTH, IS_STOP, IS_SPACE, IS_PUNCT, LIKE_NUM]
+# Lemma hashes of ALLOWED_VERBS, so verb filtering is an np.isin on the LEMMA column (input is lowercased)
+ALLOWED_VERB_IDS = np.array([hash_string(v) for v in ALLOWED_VERBS], dtype=np.uint64)
+
+def _token_terms(doc, cols, terms: set) -> None:
+    """
+    Single-token terms (code-like tokens, noun/propn lemmas, allowed verbs + -ing forms). Token flags and
+    verb lemmas are filtered on the Doc.to_array columns in NumPy; only distinct surviving ids become strings.
+    """
+    pos, lemma_ids, orth_ids, is_stop, is_space, is_punct, like_num = cols
+    keep = (is_space == 0) & (is_punct == 0) & (like_num == 0)   # like_num: 2020, five, 1,000...
+    strings = doc.vocab.strings
+
+    # Code-like tokens (az-104, hl7_fhir) are kept as-is and skip the POS passes; one regex per distinct text
+    codey_ids = []
+    for orth_id in np.unique(orth_ids[keep]).tolist():
+        text = strings[orth_id]
+        if CODEY_PATTERN.fullmatch(text) and not NUMERIC_RE.fullmatch(text):
+            codey_ids.append(orth_id)
+            _add_normalized(text, terms)
+    if codey_ids:
+        keep &= ~np.isin(orth_ids, np.array(codey_ids, dtype=orth_ids.dtype))
+
+    nounish = keep & np.isin(pos, (NOUN, PROPN)) & (is_stop == 0)
+    verbs = keep & (pos == VERB) & np.isin(lemma_ids, ALLOWED_VERB_IDS)
+    rows = np.flatnonzero(nounish | verbs)
+    if not rows.size:
+        return
+
+    pairs = np.unique(np.column_stack((lemma_ids[rows], orth_ids[rows], nounish[rows])), axis=0)
+    for lemma_id, orth_id, is_noun in pairs.tolist():
+        if NUMERIC_RE.fullmatch(strings[orth_id]):           # 01/02/2020, 3.5...
+            continue
+        lemma = strings[lemma_id].lower().strip()
+        if is_noun:
+            if lemma and lemma not in stop_words:
+                _add_normalized(lemma, terms)
+        else:
+            _add_normalized(lemma, terms)
+            _add_normalized(_VERB_ING_FORMS[lemma], terms)
+
+def _chunk_terms(doc, cols, terms: set) -> None:
+    """Short (1-4 word) phrases from POS runs, trimmed of edge stopwords; lemma strings only for kept tokens."""
+    pos, lemma_ids, _, is_stop, is_space, is_punct, _ = cols
+    skip = (is_space | is_punct).tolist()
+    stop = is_stop.tolist()
+    lemma_ids = lemma_ids.tolist()
+    strings = doc.vocab.strings
+    for lo, hi in _pos_runs(pos):
+        idx = [i for i in range(lo, hi) if not skip[i]]
+        a, b = 0, len(idx)                      # trim edge stopwords by index, slice once
+        while a < b and stop[idx[a]]:
+            a += 1
+        while b > a and stop[idx[b - 1]]:
+            b -= 1
+        if 1 <= b - a <= 4:
+            _add_normalized(_normalize_phrase(strings[lemma_ids[i]] for i in idx[a:b] if not stop[i]), terms)
+
+def _terms_from_doc(doc) -> set:
     terms = set()
 
+    # Token attributes as one (n_attrs, n_tokens) array, shared by the single-token and chunk passes
+    cols = doc.to_array(_TOKEN_ATTRS).reshape(-1, len(_TOKEN_ATTRS)).T
+
     # 1) Single tokens
-    for tok in doc:
-        if tok.is_space or tok.is_punct:
-            continue
-        if tok.ent_type_ in {"DATE", "TIME", "MONEY", "ORDINAL", "CARDINAL"}:
-            continue
+    _token_terms(doc, cols, terms)
 
-        if ACRONYM_PATTERN.fullmatch(tok.text):           # QA, API, ETL, SQL, HTTP, REST...
-            terms.add(tok.text.lower())
-            continue
+    # 2) Noun chunks (short phrases)
+    _chunk_terms(doc, cols, terms)
 
-        if CODEY_PATTERN.fullmatch(tok.text):             # AZ-104, DHIS2-like
-            terms.add(tok.text.lower())
-            continue
+    # 3) Known skill phrases (CATEGORY_HINTS), found directly even when tagging/chunking splits them
+    for _, start, end in get_hint_matcher()(doc):
+        _add_normalized(doc[start:end].text, terms)
 
-        if tok.pos_ in {"NOUN", "PROPN"}:
-            lemma = tok.lemma_.lower().strip()
-            if lemma and lemma not in stop_words and lemma not in STOP_PHRASES:
-                terms.add(SYNONYMS_MAP.get(lemma, lemma))
-            continue
+    return terms
 
-        if tok.pos_ == "VERB":
-            lemma = tok.lemma_.lower().strip()
-            if lemma in ALLOWED_VERBS and lemma not in STOP_PHRASES:
-                terms.add(lemma)
-                if lemma.endswith("e"):
-                    terms.add(lemma[:-1] + "ing")
-                else:
-                    terms.add(lemma + "ing")
+# Above this many characters (all texts combined) nlp.pipe spreads docs over 2 worker processes.
+# Below it, fork + pickling costs more than it saves, so typical 1-2 page resumes stay in-process.
+PARALLEL_PARSE_CHARS = 50_000
 
-    # 2) Noun chunks (short phrases)
-    for chunk in doc.noun_chunks:
-        words = [t for t in chunk if not t.is_space and not t.is_punct]
-        while words and (words[0].is_stop or words[0].is_space or words[0].is_punct):
-            words = words[1:]
-        while words and (words[-1].is_stop or words[-1].is_space or words[-1].is_punct):
-            words = words[:-1]
-        if not words:
-            continue
-        if 1 <= len(words) <= 4:
-            phrase = _normalize_phrase(words)
-            if phrase:
-                terms.add(phrase)
+def extract_terms_batch(texts) -> list:
+    """Runs all texts through one nlp.pipe() pass and returns a term set per text (same order)."""
+    nlp = get_nlp()
+    cleaned = [_strip_stop_phrases(t) for t in texts]
+    if sum(map(len, cleaned)) > PARALLEL_PARSE_CHARS:
+        docs = nlp.pipe(cleaned, batch_size=1, n_process=2)
+    else:
+        docs = nlp.pipe(cleaned, batch_size=8, n_process=1)
+    return [_terms_from_doc(doc) for doc in docs]
 
-    # 3) Post-normalization folding
-    normalized = set()
-    for t in terms:
-        t2 = SYNONYMS_MAP.get(t, t)
-        t2 = re.sub(r"\s{2,}", " ", t2.strip())
-        if t2 and t2 not in STOP_PHRASES:
-            normalized.add(t2)
+@st.cache_data(max_entries=64, show_spinner=False)
+def _extract_terms_cached(text_keys: tuple, _texts: tuple, syn_version: str, stop_version: str) -> list:
+    # Keyed on BLAKE2 digests of the texts (Streamlit skips hashing `_texts`) plus the config versions,
+    # since extraction reads the live SYNONYMS_MAP / STOP_PHRASES.
+    return extract_terms_batch(list(_texts))
 
-    return normalized
+TERMS_STORE_MAX = 32  # per-session (digest, versions) -> terms entries kept by extract_terms_cached
+
+def extract_terms_cached(texts) -> list:
+    """
+    extract_terms_batch() with per-text reuse across reruns. Each text's terms are kept in session state
+    under its digest + config versions, so editing the JD doesn't reparse unchanged resume pages;
+    only the misses go through (one batch of) spaCy.
+    """
+    versions = (st.session_state["syn_version"], st.session_state["stop_version"])
+    store = st.session_state.setdefault("terms_by_text", {})
+    keys = [(_digest(t.encode("utf-8")), *versions) for t in texts]
+    misses = [i for i, k in enumerate(keys) if k not in store]
+    if misses:
+        fresh = _extract_terms_cached(tuple(keys[i][0] for i in misses), tuple(texts[i] for i in misses), *versions)
+        for i, terms in zip(misses, fresh):
+            store[keys[i]] = terms
+        while len(store) > TERMS_STORE_MAX:
+            store.pop(next(iter(store)))  # oldest first (dict insertion order)
+    return [store[k] for k in keys]
 
 # ---------------- Matching helpers (exact, synonym, fuzzy) ----------------
 CATEGORY_HINTS = {
@@ -355,18 +536,25 @@ CATEGORY_HINTS = {
     "remote-first": "important",
 }
 
-def expand_synonyms(term: str) -> set:
+@st.cache_resource(show_spinner=False)
+def get_hint_matcher():
+    """PhraseMatcher over CATEGORY_HINTS keys, built once per process."""
+    nlp = get_nlp()
+    matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+    matcher.add("HINT", [nlp.make_doc(k) for k in CATEGORY_HINTS])
+    return matcher
+
+# Streamlit re-executes this script on every rerun, so the cache never outlives the current SYNONYMS_MAP
+@functools.lru_cache(maxsize=4096)
+def expand_synonyms(term: str) -> frozenset:
     base = normalize_term(term)
-    variants = {base}
     # reverse lookup
-    for k, v in SYNONYMS_MAP.items():
-        if v == base:
-            variants.add(k)
+    variants = {base, *SYNONYMS_INV.get(base, ())}
     if not base.endswith("s"):
         variants.add(base + "s")
     else:
         variants.add(base.rstrip("s"))
-    return {normalize_term(v) for v in variants}
+    return frozenset(normalize_term(v) for v in variants)
 
 # Build scoring config from weights.yaml (instead of hard-coded)
 def get_scoring_config():
@@ -388,112 +576,167 @@ def get_scoring_config():
 # Precompiled token regex (FIXED: safe dash placement/escaping)
 TOKEN_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-\/ ]{1,40}")
 
-def any_exact_or_fuzzy_match(term: str, resume_terms: set, resume_text: str, threshold: int) -> tuple[bool, str]:
+def fuzzy_match_terms(terms: list, thresholds: list, resume_terms_list: list, resume_tokens: list) -> dict:
     """
-    Tries exact match, synonym exact, then fuzzy against resume_terms and resume_text.
-    Returns (matched, method) where method in {"exact","synonym","fuzzy-terms","fuzzy-text","no"}.
+    Batch fuzzy step for terms with no exact/synonym hit. Each term and its synonym variants are scored
+    (partial_ratio) against all resume terms in one cdist call, then whatever is still unmatched against
+    the raw resume text tokens in a second call. Returns {term: "fuzzy-terms" | "fuzzy-text" | "no"}.
+    No length-difference prefilter: partial_ratio aligns the shorter string inside the longer one
+    ("api" vs "rest api design" = 100), so only score_cutoff can prune safely.
     """
-    base = normalize_term(term)
-    syns = expand_synonyms(base)
-
-    # 1) exact in extracted terms
-    if base in resume_terms:
-        return True, "exact"
-    if syns.intersection(resume_terms):
-        return True, "synonym"
-
-    # 2) fuzzy vs extracted terms
-    for rt in resume_terms:
-        if fuzz.partial_ratio(base, rt) >= threshold:
-            return True, "fuzzy-terms"
-        for s in syns:
-            if fuzz.partial_ratio(s, rt) >= threshold:
-                return True, "fuzzy-terms"
-
-    # 3) fuzzy vs raw text (backup)
-    tokens = set(TOKEN_RE.findall(resume_text.lower()))
-    for tok in tokens:
-        if fuzz.partial_ratio(base, tok) >= threshold:
-            return True, "fuzzy-text"
-        for s in syns:
-            if fuzz.partial_ratio(s, tok) >= threshold:
-                return True, "fuzzy-text"
-
-    return False, "no"
-
-def categorize_term(term: str) -> str:
+    methods = {t: "no" for t in terms}
+    for method, choices in (("fuzzy-terms", resume_terms_list), ("fuzzy-text", resume_tokens)):
+        todo = [(t, th) for t, th in zip(terms, thresholds) if methods[t] == "no"]
+        if not todo or not choices:
+            continue
+        queries, owners = [], []          # owners[i] -> index into todo for queries[i]
+        for i, (t, _) in enumerate(todo):
+            base = normalize_term(t)
+            for q in (base, *(expand_synonyms(base) - {base})):
+                queries.append(q)
+                owners.append(i)
+        scores = process.cdist(queries, choices, scorer=fuzz.partial_ratio,
+                               score_cutoff=min(th for _, th in todo), workers=-1)
+        for best, i in zip(scores.max(axis=1), owners):
+            t, th = todo[i]
+            if best >= th:
+                methods[t] = method
+    return methods
+
+def resume_text_tokens(resume_text: str) -> list:
+    """Raw-text tokens for the fuzzy backup; build once per resume, not once per JD term."""
+    return list(set(TOKEN_RE.findall(resume_text.lower())))
+
+# Substring fallbacks for categorize_term, one alternation scan instead of a Python `in` per keyword
+_CRIT_KW = ("qa","rest api","api","http status","javascript","etl","integration","sql","postgresql","test case")
+_IMP_KW  = ("troubleshoot","debug","documentation","customer service","salesforce","dhis2","commcare","kobo toolbox","openmrs","remote")
+_CRITICAL_SUB  = re.compile("|".join(map(re.escape, _CRIT_KW)))
+_IMPORTANT_SUB = re.compile("|".join(map(re.escape, _IMP_KW)))
+
+# Categories as int codes (0=critical, 1=important, 2=nice) so weights/thresholds are tuple/array lookups
+CATEGORIES = ("critical", "important", "nice")
+CRITICAL, IMPORTANT, NICE = range(len(CATEGORIES))
+CATEGORY_DTYPE = pd.CategoricalDtype(CATEGORIES, ordered=True)  # breakdown table sorts critical -> nice
+_HINT_CODES = {k: CATEGORIES.index(v) for k, v in CATEGORY_HINTS.items()}
+
+@functools.lru_cache(maxsize=2048)
+def categorize_term(term: str) -> int:
     t = normalize_term(term)
-    if t in CATEGORY_HINTS:
-        return CATEGORY_HINTS[t]
-    if any(k in t for k in ["qa","rest api","api","http status","javascript","etl","integration","sql","postgresql","test case"]):
-        return "critical"
-    if any(k in t for k in ["troubleshoot","debug","documentation","customer service","salesforce","dhis2","commcare","kobo toolbox","openmrs","remote"]):
-        return "important"
-    return "nice"
+    if t in _HINT_CODES:
+        return _HINT_CODES[t]
+    if _CRITICAL_SUB.search(t):
+        return CRITICAL
+    if _IMPORTANT_SUB.search(t):
+        return IMPORTANT
+    return NICE
 
 def score_weighted(jd_terms: set, resume_terms: set, resume_text: str):
     SCORING_CONFIG = get_scoring_config()
-    items = []
-    total_possible = 0.0
-    total_earned = 0.0
-
-    for term in sorted(jd_terms):
-        category = categorize_term(term)
-        weight = SCORING_CONFIG["weights"][category]
-        threshold = SCORING_CONFIG["thresholds"][category]
-
-        matched, method = any_exact_or_fuzzy_match(term, resume_terms, resume_text, threshold)
-
-        earned = weight if matched else 0.0
-        total_possible += weight
-        total_earned += earned
-
-        items.append({
-            "Term": term,
-            "Category": category,
-            "Matched": "✅" if matched else "❌",
-            "Method": method if matched != "no" else "-",
-            "Weight": round(weight, 2),
-            "Earned": round(earned, 2),
-        })
+    WEIGHT_VEC = np.array([SCORING_CONFIG["weights"][c] for c in CATEGORIES], dtype=float)
+    THRESH_VEC = tuple(SCORING_CONFIG["thresholds"][c] for c in CATEGORIES)
+    resume_terms_list = list(resume_terms)
+    resume_tokens = resume_text_tokens(resume_text)
+
+    # Resolve exact and synonym hits in bulk with set ops; only the remainder goes through RapidFuzz
+    exact_hits = jd_terms & resume_terms
+    synonym_hits = {t for t in jd_terms - exact_hits if expand_synonyms(t) & resume_terms}
+
+    # Everything else is scored in one batched cdist pass (per-term category thresholds).
+    # No sort needed: each term's best score is independent of query order; display order is set below.
+    pending = list(jd_terms - exact_hits - synonym_hits)
+    fuzzy_methods = fuzzy_match_terms(
+        pending,
+        [THRESH_VEC[categorize_term(t)] for t in pending],
+        resume_terms_list,
+        resume_tokens,
+    )
+
+    # Columnar scoring: weights / matched flags as arrays, totals as array sums
+    terms = sorted(jd_terms)
+    categories = np.fromiter((categorize_term(t) for t in terms), dtype=np.intp, count=len(terms))
+    methods = ["exact" if t in exact_hits else "synonym" if t in synonym_hits else fuzzy_methods[t] for t in terms]
+    weights = WEIGHT_VEC[categories]
+    matched = np.array([m != "no" for m in methods], dtype=bool)
+    earned = np.where(matched, weights, 0.0)
+    total_possible = float(weights.sum())
+    total_earned = float(earned.sum())
+
+    # Display order: weight desc, missing before matched, alphabetical within ties (lexsort is stable)
+    order = np.lexsort((matched, -weights))
+    items = [
+        {
+            "Term": terms[i],
+            "Category": CATEGORIES[categories[i]],
+            "Matched": "✅" if matched[i] else "❌",
+            "Method": methods[i],
+            "Weight": round(float(weights[i]), 2),
+            "Earned": round(float(earned[i]), 2),
+        }
+        for i in order
+    ]
 
     score = round((total_earned / total_possible) * 100, 2) if total_possible > 0 else 0.0
     return score, items, total_possible, total_earned
 
 # ---------------- Inputs ----------------
-resume_file = st.file_uploader(
-    "📎 Upload Your Resume (.pdf, .docx, .rtf, .txt)",
-    type=["pdf", "docx", "rtf", "txt"]
-)
-
-jd_text = st.text_area(
-    "🧾 Paste the Job Description here:",
-    height=220,
-    placeholder="Copy and paste the full job description here..."
-)
+# Inside a form, uploads / JD edits don't rerun the script; values are committed on "Analyze"
+# (and kept for later reruns from the result widgets)
+with st.form("analyze_form"):
+    resume_file = st.file_uploader(
+        "📎 Upload Your Resume (.pdf, .docx, .rtf, .txt)",
+        type=["pdf", "docx", "rtf", "txt"]
+    )
+
+    jd_text = st.text_area(
+        "🧾 Paste the Job Description here:",
+        height=220,
+        placeholder="Copy and paste the full job description here..."
+    )
+
+    st.form_submit_button("🔍 Analyze")
+
+# ---------------- Previews ----------------
+PREVIEW_CHARS = 4000  # longer texts are cut in the preview unless the user asks for the full text
+
+def show_preview(label: str, text: str, what: str) -> None:
+    # Only the first PREVIEW_CHARS are sent to the browser on each rerun by default
+    if len(text) > PREVIEW_CHARS and not st.toggle(f"Show full {what}", value=False, key=f"full_preview_{what}"):
+        text = text[:PREVIEW_CHARS] + "\n…(truncated)"
+    st.text_area(label, text, height=160)
 
 # ---------------- Main analysis ----------------
 if resume_file and jd_text.strip():
-    resume_text = extract_text_from_any(resume_file, resume_file.name)
+    resume_pages = extract_pages_cached(resume_file.getvalue(), resume_file.name)
+    resume_text = "\n".join(resume_pages)
 
     # Previews
     st.subheader("📄 Resume Preview")
-    st.text_area("Your Resume Content", resume_text, height=160)
+    show_preview("Your Resume Content", resume_text, "resume")
 
     st.subheader("🧾 Job Description Preview")
-    st.text_area("Job Description Content", jd_text, height=160)
+    show_preview("Job Description Content", jd_text, "job description")
 
     # --- Extract terms
-    jd_terms = extract_terms(jd_text)
-    resume_terms = extract_terms(resume_text)
+    # JD + every resume page go through one nlp.pipe batch; page term sets are merged
+    jd_terms, *page_terms = extract_terms_cached((jd_text, *resume_pages))
+    resume_terms = set().union(*page_terms)
 
     # --- Simple (unweighted) match for reference
-    simple_matched = sorted(jd_terms.intersection(resume_terms))
-    simple_missing = sorted(jd_terms.difference(resume_terms))
+    # one pass over the sorted JD terms partitions them (both lists come out sorted)
+    simple_matched, simple_missing = [], []
+    for t in sorted(jd_terms):
+        (simple_matched if t in resume_terms else simple_missing).append(t)
     simple_score = round((len(simple_matched) / len(jd_terms) * 100), 2) if jd_terms else 0.0
 
     # --- Weighted score
-    weighted_score, items, total_possible, total_earned = score_weighted(jd_terms, resume_terms, resume_text)
+    # Widget clicks below (toggles, downloads) rerun the script; reuse the last result while inputs/configs match
+    score_key = (_digest(jd_text.encode("utf-8")), _digest(resume_file.getvalue()),
+                 st.session_state["syn_version"], st.session_state["stop_version"], _config_version(WEIGHTS_CFG))
+    last_score = st.session_state.get("last_weighted")
+    if last_score is None or last_score[0] != score_key:
+        last_score = (score_key, score_weighted(jd_terms, resume_terms, resume_text))
+        st.session_state["last_weighted"] = last_score
+    weighted_score, items, total_possible, total_earned = last_score[1]
 
     # Top summary (two scores side-by-side)
     st.subheader("📊 Summary")
@@ -512,17 +755,13 @@ if resume_file and jd_text.strip():
 
         # CSV download for simple match lists
         if simple_matched or simple_missing:
-            import io as _io
-            buf = _io.StringIO()
-            writer = csv.writer(buf)
-            writer.writerow(["Term", "Status"])
-            for t in simple_matched:
-                writer.writerow([t, "Matched"])
-            for t in simple_missing:
-                writer.writerow([t, "Missing"])
+            simple_df = pd.DataFrame({
+                "Term": simple_matched + simple_missing,
+                "Status": ["Matched"] * len(simple_matched) + ["Missing"] * len(simple_missing),
+            })
             st.download_button(
                 "Download simple match as CSV",
-                buf.getvalue(),
+                simple_df.to_csv(index=False),
                 file_name="simple_match.csv",
                 mime="text/csv"
             )
@@ -531,8 +770,8 @@ if resume_file and jd_text.strip():
     st.subheader("📈 Weighted Match (ATS-style)")
     st.caption("Critical terms count more than nice-to-have ones. Synonyms and fuzzy matches are accepted.")
 
-    # Sort by importance (weight desc) then matched
-    items_sorted = sorted(items, key=lambda d: (d["Weight"], d["Matched"]), reverse=True)
+    # Already sorted by importance (weight desc) then matched in score_weighted
+    items_sorted = items
 
     # Group into Critical / Important / Nice (matched/missing)
     groups = {"critical": {"matched": [], "missing": []},
@@ -543,50 +782,51 @@ if resume_file and jd_text.strip():
         bucket = row["Category"]
         (groups[bucket]["matched"] if row["Matched"] == "✅" else groups[bucket]["missing"]).append(row["Term"])
 
+    # Sort each list once; the expanders and suggestions below reuse them as-is
+    for lists in groups.values():
+        lists["matched"].sort()
+        lists["missing"].sort()
+
     # Expanders per group
     for bucket, label in [("critical", "Critical"), ("important", "Important"), ("nice", "Nice to Have")]:
         with st.expander(f"{label} — Matched ({len(groups[bucket]['matched'])}) / Missing ({len(groups[bucket]['missing'])})", expanded=False):
             if groups[bucket]["matched"]:
-                st.markdown(f"**Matched:** `{', '.join(sorted(groups[bucket]['matched']))}`")
+                st.markdown(f"**Matched:** `{', '.join(groups[bucket]['matched'])}`")
             if groups[bucket]["missing"]:
-                st.markdown(f"**Missing:** `{', '.join(sorted(groups[bucket]['missing']))}`")
+                st.markdown(f"**Missing:** `{', '.join(groups[bucket]['missing'])}`")
 
     # Details toggle + full breakdown CSV
     show_details = st.toggle("Show detailed breakdown", value=False)
     if show_details:
         st.markdown("**Term Impact Breakdown**")
-        st.table(items_sorted)
+        # One frame for both the table and the CSV; low-cardinality text columns as categoricals
+        items_df = pd.DataFrame(items_sorted, columns=["Term", "Category", "Matched", "Method", "Weight", "Earned"])
+        items_df = items_df.astype({"Category": CATEGORY_DTYPE, "Matched": "category", "Method": "category"})
+        st.dataframe(items_df, use_container_width=True, hide_index=True)
 
         if items_sorted:
-            import io as _io2
-            buf2 = _io2.StringIO()
-            writer2 = csv.DictWriter(buf2, fieldnames=list(items_sorted[0].keys()))
-            writer2.writeheader()
-            writer2.writerows(items_sorted)
             st.download_button(
                 "Download breakdown as CSV",
-                buf2.getvalue(),
+                items_df.to_csv(index=False),
                 file_name="ats_breakdown.csv",
                 mime="text/csv"
             )
 
     # Suggestions (weighted perspective)
-    missing_weighted = [d["Term"] for d in items if d["Matched"] == "❌"]
+    # Prioritize by category (already grouped and sorted above)
+    critical_missing = groups["critical"]["missing"]
+    important_missing = groups["important"]["missing"]
+    other_missing = groups["nice"]["missing"]
     st.subheader("💡 Copilot-style Suggestions")
-    if missing_weighted:
-        # Prioritize by category
-        critical_missing = [t for t in missing_weighted if categorize_term(t) == "critical"]
-        important_missing = [t for t in missing_weighted if categorize_term(t) == "important"]
-
+    if critical_missing or important_missing or other_missing:
         if critical_missing:
             st.markdown("• **Top priority (Critical):**")
-            st.markdown(f"`{', '.join(sorted(set(critical_missing)))}`")
+            st.markdown(f"`{', '.join(critical_missing)}`")
         if important_missing:
             st.markdown("• **Next (Important):**")
-            st.markdown(f"`{', '.join(sorted(set(important_missing)))}`")
+            st.markdown(f"`{', '.join(important_missing)}`")
 
         # Everything else
-        other_missing = sorted(set(missing_weighted) - set(critical_missing) - set(important_missing))
         if other_missing:
             st.markdown("• **Nice to have:**")
             st.markdown(f"`{', '.join(other_missing)}`")
@@ -604,13 +844,16 @@ if resume_file and jd_text.strip():
                 try:
                     user_syn = _safe_read_json(SYN_USER_PATH, {})
                     user_syn[miss.lower()] = present.lower()
-                    with open(SYN_USER_PATH, "w", encoding="utf-8") as f:
-                        json.dump(user_syn, f, indent=2)
+                    _atomic_write_json(SYN_USER_PATH, user_syn)
                     st.success(f"Saved: '{miss}' ≈ '{present}'.")
                     # Refresh merged synonyms in-session
                     base_syn = _safe_read_json(SYN_BASE_PATH, BUILTIN_SYNONYMS)
-                    st.session_state["synonyms"] = {**base_syn, **user_syn}
-                    st.session_state["cfg_mtimes"]["syn_user"] = os.path.getmtime(SYN_USER_PATH)
+                    st.session_state["synonyms"] = _merge_synonyms(base_syn, user_syn)
+                    st.session_state["syn_version"] = _config_version(st.session_state["synonyms"])
+                    st.session_state["synonyms_inv"] = _invert_synonyms(st.session_state["synonyms"])
+                    sig = list(st.session_state["cfg_sig"])
+                    sig[CFG_PATHS.index(SYN_USER_PATH)] = _stat_many([SYN_USER_PATH])[0]
+                    st.session_state["cfg_sig"] = tuple(sig)
                 except Exception as e:
                     st.error(f"Could not save synonym: {e}")
 